@@ -0,0 +1,533 @@
+"""
+Teste de carga do `app:server` sob diferentes configurações do gunicorn.
+
+Sobe o servidor localmente para cada configuração (workers, threads, worker
+class), dispara sequências de POSTs em `_dash-update-component` simulando
+vários usuários clicando nos filtros e mede vazão, latência p50/p95/p99 e a
+memória (RSS) de cada worker. O resultado sai em uma tabela no terminal e,
+opcionalmente, em JSON/CSV para comparar execuções.
+
+Exemplo:
+    python loadtest.py --criminal-file SPDadosCriminais_SAO_PAULO_limpo.xlsx \
+        --configs 1:1:sync 2:1:sync 2:4:gthread 4:4:gthread \
+        --clientes 20 --duracao 60 --saida resultado.json
+"""
+import argparse
+import csv
+import http.client
+import json
+import math
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BASE_PATH = '/dashboard/'
+
+# Peso de cada filtro na escolha do próximo clique: região, mês e bairro
+# são os mais usados; cidade tem um único valor na prática.
+PESOS_FILTROS = {
+    'filtro-mes': 5,
+    'filtro-regiao': 4,
+    'filtro-bairro': 4,
+    'filtro-natureza': 3,
+    'filtro-hora': 2,
+    'filtro-evento': 2,
+    'filtro-cidade': 1,
+}
+PROB_LIMPAR = 0.25  # chance de um clique limpar um filtro já preenchido
+MAX_FILTROS_ATIVOS = 3  # usuários raramente combinam mais que isso
+MAX_TAXA_ERRO_PCT = 1.0  # acima disso a configuração é marcada como inválida
+PAUSA_PADRAO_S = 2.0  # tempo médio entre cliques de um usuário
+
+
+# ==============================
+# 1) CONFIGURAÇÕES E SERVIDOR
+# ==============================
+def parse_config(texto):
+    """Converte 'workers:threads:classe' (ex.: '2:4:gthread') em dict."""
+    partes = texto.split(':')
+    if len(partes) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"Configuração inválida: '{texto}' (use workers:threads[:classe])")
+    try:
+        workers, threads = int(partes[0]), int(partes[1])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Configuração inválida: '{texto}' (workers e threads devem ser inteiros)")
+    classe = partes[2] if len(partes) == 3 else ('gthread' if threads > 1 else 'sync')
+    # Só o gthread usa --threads: o gunicorn troca 'sync' por 'gthread' e as
+    # classes assíncronas (gevent, eventlet...) ignoram a opção, então o
+    # relatório ficaria com o nome ou o número de threads errado.
+    if classe != 'gthread' and threads > 1:
+        raise argparse.ArgumentTypeError(
+            f"Configuração inválida: '{texto}' ({classe} usa 1 thread; use gthread para mais threads)")
+    return {'workers': workers, 'threads': threads, 'worker_class': classe}
+
+
+def nome_config(config):
+    return f"{config['workers']}w x {config['threads']}t ({config['worker_class']})"
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(config, porta, env, timeout):
+    cmd = [
+        sys.executable, '-m', 'gunicorn', 'app:server',
+        '--bind', f'127.0.0.1:{porta}',
+        '--workers', str(config['workers']),
+        '--threads', str(config['threads']),
+        '--worker-class', config['worker_class'],
+        '--timeout', '120',
+        '--log-level', 'warning',
+    ]
+    processo = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    url = f'http://127.0.0.1:{porta}{BASE_PATH}_dash-dependencies'
+    limite = time.monotonic() + timeout
+    # O app carrega a planilha na importação, então a subida pode demorar.
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"gunicorn encerrou com código {processo.returncode} ao subir {nome_config(config)}")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                if resp.status == 200:
+                    return processo
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.5)
+    parar_servidor(processo)
+    raise RuntimeError(f"Servidor não respondeu em {timeout}s para {nome_config(config)}")
+
+
+def parar_servidor(processo):
+    if processo.poll() is None:
+        processo.send_signal(signal.SIGTERM)
+        try:
+            processo.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+            processo.wait()
+
+
+def pids_workers(pid_master):
+    """Lista os PIDs filhos do master do gunicorn lendo /proc (Linux)."""
+    pids = []
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                # O nome do processo pode conter espaços; o ppid vem após o ')'.
+                campos = f.read().rsplit(')', 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError, PermissionError, IndexError):
+            continue
+        if int(campos[1]) == pid_master:
+            pids.append(int(entrada))
+    return pids
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1]) / 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return None
+
+
+class AmostradorRSS(threading.Thread):
+    """
+    Registra o RSS dos workers enquanto o teste roda: o pico de cada PID e o
+    maior total simultâneo entre os workers vivos em uma mesma amostra. Workers
+    reiniciados pelo gunicorn não entram no total depois de encerrados.
+    """
+
+    def __init__(self, pid_master, intervalo=0.5):
+        super().__init__(daemon=True)
+        self.pid_master = pid_master
+        self.intervalo = intervalo
+        self.picos = {}
+        self.vivos = []
+        self.pico_total = 0.0
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            amostra = {}
+            for pid in pids_workers(self.pid_master):
+                valor = rss_mb(pid)
+                if valor is not None:
+                    amostra[pid] = valor
+                    self.picos[pid] = max(self.picos.get(pid, 0.0), valor)
+            if amostra:
+                self.vivos = list(amostra)
+                self.pico_total = max(self.pico_total, sum(amostra.values()))
+            self._parar.wait(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+# ==============================
+# 2) CENÁRIOS DE CLIQUES
+# ==============================
+def carregar_callback(base_url):
+    """Lê o callback principal (entradas `filtro-*`) de `_dash-dependencies`."""
+    with urllib.request.urlopen(base_url + '_dash-dependencies', timeout=30) as resp:
+        dependencias = json.load(resp)
+    for dep in dependencias:
+        if dep['inputs'] and all(i['id'].startswith('filtro-') for i in dep['inputs']):
+            saida = dep['output']
+            if saida.startswith('..'):
+                alvos = saida[2:-2].split('...')
+            else:
+                alvos = [saida]
+            outputs = [dict(zip(('id', 'property'), alvo.rsplit('.', 1))) for alvo in alvos]
+            return {'output': saida, 'outputs': outputs if len(outputs) > 1 else outputs[0], 'inputs': dep['inputs']}
+    raise RuntimeError("Callback dos filtros não encontrado em _dash-dependencies")
+
+
+def carregar_opcoes(base_url):
+    """Extrai os valores possíveis de cada dropdown `filtro-*` do layout."""
+    with urllib.request.urlopen(base_url + '_dash-layout', timeout=30) as resp:
+        layout = json.load(resp)
+    opcoes = {}
+    pilha = [layout]
+    while pilha:
+        no = pilha.pop()
+        if isinstance(no, dict):
+            props = no.get('props', {})
+            id_ = props.get('id')
+            if isinstance(id_, str) and id_.startswith('filtro-'):
+                opcoes[id_] = [o['value'] for o in props.get('options') or []]
+            pilha.extend(no.values())
+        elif isinstance(no, list):
+            pilha.extend(no)
+    return opcoes
+
+
+def gerar_sessoes(opcoes, n_sessoes, cliques_por_sessao, seed):
+    """
+    Gera sessões de usuário: cada clique altera um filtro (ou o limpa) a partir
+    do estado anterior, como acontece na interface.
+    """
+    if n_sessoes < 1 or cliques_por_sessao < 1:
+        raise ValueError("É preciso gerar ao menos uma sessão com ao menos um clique")
+    rng = random.Random(seed)
+    filtros = [f for f in PESOS_FILTROS if opcoes.get(f)]
+    if not filtros:
+        raise RuntimeError("Nenhum filtro com opções encontrado em _dash-layout")
+    pesos = [PESOS_FILTROS[f] for f in filtros]
+    sessoes = []
+    for _ in range(n_sessoes):
+        estado = {}
+        cliques = []
+        for _ in range(cliques_por_sessao):
+            ativos = [f for f in estado if estado[f] is not None]
+            if ativos and (rng.random() < PROB_LIMPAR or len(ativos) >= MAX_FILTROS_ATIVOS):
+                filtro = rng.choice(ativos)
+                estado[filtro] = None
+            else:
+                filtro = rng.choices(filtros, weights=pesos)[0]
+                estado[filtro] = rng.choice(opcoes[filtro])
+            cliques.append({'filtro': filtro, 'estado': dict(estado)})
+        sessoes.append(cliques)
+    return sessoes
+
+
+def carregar_sessoes(caminho):
+    """
+    Lê sessões gravadas: lista de sessões, cada uma lista de estados
+    ({'filtro-mes': 3, 'filtro-regiao': 'Zona Sul', ...}) na ordem dos cliques.
+    """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        gravadas = json.load(f)
+    if not isinstance(gravadas, list) or not gravadas:
+        raise ValueError(f"'{caminho}' deve conter uma lista não vazia de sessões")
+    for n, estados in enumerate(gravadas):
+        if not isinstance(estados, list) or not estados:
+            raise ValueError(f"'{caminho}': a sessão {n} deve ser uma lista não vazia de estados")
+        if not all(isinstance(estado, dict) for estado in estados):
+            raise ValueError(f"'{caminho}': a sessão {n} deve conter apenas objetos {{filtro: valor}}")
+    sessoes = []
+    for estados in gravadas:
+        anterior = {}
+        cliques = []
+        for estado in estados:
+            alterados = [k for k in sorted(set(estado) | set(anterior)) if estado.get(k) != anterior.get(k)]
+            cliques.append({'filtro': alterados[0] if alterados else next(iter(estado), None), 'estado': dict(estado)})
+            anterior = estado
+        sessoes.append(cliques)
+    return sessoes
+
+
+def montar_payload(callback, clique):
+    estado = clique['estado']
+    inputs = [dict(i, value=estado.get(i['id'])) for i in callback['inputs']]
+    filtro = clique['filtro']
+    return json.dumps({
+        'output': callback['output'],
+        'outputs': callback['outputs'],
+        'inputs': inputs,
+        'changedPropIds': [f'{filtro}.value'] if filtro else [],
+        'state': [],
+    }).encode('utf-8')
+
+
+# ==============================
+# 3) EXECUÇÃO DA CARGA
+# ==============================
+def enviar(url, payload, timeout):
+    req = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except (http.client.HTTPException, OSError):
+        # OSError cobre URLError, timeouts e conexões recusadas/resetadas.
+        ok = False
+    return time.perf_counter() - inicio, ok
+
+
+def percentil(valores_ordenados, p):
+    """Percentil pelo método nearest-rank."""
+    if not valores_ordenados:
+        return None
+    k = max(0, min(len(valores_ordenados) - 1, math.ceil(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[k]
+
+
+def disparar(url, payloads, clientes, duracao, timeout, pausa=0.0):
+    """
+    Envia sessões sorteadas a partir de `clientes` threads por `duracao`
+    segundos. Entre cliques cada cliente espera um tempo aleatório entre 0,5x e
+    1,5x `pausa` (0 = sem pausa, teste de saturação). Toda requisição entra nas
+    latências, inclusive as que falharam.
+    """
+    latencias = []
+    erros = [0]
+    trava = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente(indice):
+        rng = random.Random(indice)
+        locais, falhas = [], 0
+        try:
+            while time.monotonic() < fim:
+                for payload in payloads[rng.randrange(len(payloads))]:
+                    if time.monotonic() >= fim:
+                        break
+                    tempo, ok = enviar(url, payload, timeout)
+                    locais.append(tempo)
+                    if not ok:
+                        falhas += 1
+                    if pausa > 0:
+                        time.sleep(max(0.0, min(rng.uniform(0.5 * pausa, 1.5 * pausa), fim - time.monotonic())))
+        finally:
+            with trava:
+                latencias.extend(locais)
+                erros[0] += falhas
+
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, erros[0], time.monotonic() - inicio
+
+
+def rodar_carga(base_url, callback, sessoes, clientes, duracao, aquecimento, timeout, pausa=0.0,
+                concorrencia_minima=1):
+    url = base_url + '_dash-update-component'
+    payloads = [[montar_payload(callback, c) for c in sessao] for sessao in sessoes]
+
+    # Aquecimento: primeira execução de cada worker é mais lenta (imports, caches
+    # do plotly). Usa pelo menos workers x threads clientes para que todos os
+    # workers sejam aquecidos, não só o que pegar a primeira conexão. Sem pausa
+    # para que todos recebam requisições mesmo em aquecimentos curtos.
+    if aquecimento > 0:
+        disparar(url, payloads, max(clientes, concorrencia_minima), aquecimento, timeout)
+
+    latencias, erros, decorrido = disparar(url, payloads, clientes, duracao, timeout, pausa)
+
+    latencias.sort()
+    total = len(latencias)
+    taxa_erro = 100 * erros / total if total else 100.0
+    return {
+        'requisicoes': total,
+        'erros': erros,
+        'taxa_erro_pct': round(taxa_erro, 2),
+        'duracao_s': round(decorrido, 2),
+        'vazao_rps': round(total / decorrido, 2) if decorrido else 0.0,
+        'vazao_ok_rps': round((total - erros) / decorrido, 2) if decorrido else 0.0,
+        'p50_ms': _ms(percentil(latencias, 50)),
+        'p95_ms': _ms(percentil(latencias, 95)),
+        'p99_ms': _ms(percentil(latencias, 99)),
+        'max_ms': _ms(latencias[-1] if latencias else None),
+    }
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 1) if segundos is not None else None
+
+
+# ==============================
+# 4) RELATÓRIO
+# ==============================
+COLUNAS = ['config', 'workers', 'threads', 'worker_class', 'clientes', 'pausa_s', 'status', 'requisicoes', 'erros',
+           'taxa_erro_pct', 'vazao_rps', 'vazao_ok_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+           'rss_worker_max_mb', 'rss_total_mb', 'workers_reiniciados', 'falha']
+
+
+def imprimir_tabela(resultados, max_erros=MAX_TAXA_ERRO_PCT):
+    cabecalho = ['Config', 'Status', 'req/s', 'erros %', 'p50 ms', 'p95 ms', 'p99 ms', 'RSS/worker MB', 'RSS total MB']
+    linhas = [[
+        r['config'], r['status'], r.get('vazao_rps'), r.get('taxa_erro_pct'), r.get('p50_ms'), r.get('p95_ms'),
+        r.get('p99_ms'), r.get('rss_worker_max_mb'), r.get('rss_total_mb'),
+    ] for r in resultados]
+    linhas = [['-' if v is None else str(v) for v in linha] for linha in linhas]
+    larguras = [max(len(c), *(len(l[i]) for l in linhas)) if linhas else len(c) for i, c in enumerate(cabecalho)]
+    print('| ' + ' | '.join(c.ljust(w) for c, w in zip(cabecalho, larguras)) + ' |')
+    print('|' + '|'.join('-' * (w + 2) for w in larguras) + '|')
+    for linha in linhas:
+        print('| ' + ' | '.join(v.ljust(w) for v, w in zip(linha, larguras)) + ' |')
+    for r in resultados:
+        if r.get('falha'):
+            print(f"{r['config']}: {r['falha']}")
+    if any(r['status'] != 'ok' for r in resultados):
+        print(f"Configurações INVÁLIDAS (erros > {max_erros}% ou falha) não devem ser comparadas pelo p99.")
+
+
+def salvar(resultados, caminho, metadados):
+    if caminho.endswith('.csv'):
+        with open(caminho, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUNAS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(resultados)
+    else:
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump({'metadados': metadados, 'resultados': resultados}, f, ensure_ascii=False, indent=2)
+
+
+def testar_config(config, env, sessoes, args):
+    """Sobe o servidor com `config`, aplica a carga e devolve (medidas, sessoes)."""
+    porta = porta_livre()
+    base_url = f'http://127.0.0.1:{porta}{BASE_PATH}'
+    print(f"Subindo {nome_config(config)} na porta {porta}...")
+    processo = iniciar_servidor(config, porta, env, args.timeout_subida)
+    try:
+        callback = carregar_callback(base_url)
+        if sessoes is None:
+            sessoes = gerar_sessoes(carregar_opcoes(base_url), args.sessoes, args.cliques, args.seed)
+        amostrador = AmostradorRSS(processo.pid)
+        amostrador.start()
+        try:
+            medidas = rodar_carga(base_url, callback, sessoes, args.clientes, args.duracao, args.aquecimento,
+                                  args.timeout, pausa=args.pausa,
+                                  concorrencia_minima=config['workers'] * config['threads'])
+        finally:
+            amostrador.parar()
+    finally:
+        parar_servidor(processo)
+
+    picos = amostrador.picos
+    medidas.update(
+        rss_worker_max_mb=round(max(picos.values()), 1) if picos else None,
+        rss_total_mb=round(amostrador.pico_total, 1) if picos else None,
+        rss_por_worker_mb=[round(picos[pid], 1) for pid in amostrador.vivos],
+        workers_reiniciados=max(0, len(picos) - len(amostrador.vivos)),
+    )
+    return medidas, sessoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do dashboard (app:server) com gunicorn.")
+    parser.add_argument('--configs', nargs='+', type=parse_config,
+                        default=[parse_config(c) for c in ('1:1:sync', '2:1:sync', '4:1:sync', '2:4:gthread', '4:4:gthread')],
+                        help="Configurações workers:threads[:classe], ex.: 2:4:gthread")
+    parser.add_argument('--criminal-file', help="Planilha de ocorrências (CRIMINAL_FILE)")
+    parser.add_argument('--eventos-file', help="JSON de eventos (EVENTOS_FILE)")
+    parser.add_argument('--locais-file', help="JSON de locais (LOCAIS_FILE)")
+    parser.add_argument('--clientes', type=int, default=20, help="Usuários simultâneos")
+    parser.add_argument('--pausa', type=float, default=PAUSA_PADRAO_S,
+                        help="Tempo médio (s) entre cliques de cada usuário; 0 = saturação")
+    parser.add_argument('--duracao', type=float, default=30, help="Segundos de carga por configuração")
+    parser.add_argument('--sessoes', type=int, default=200, help="Sessões geradas para sortear entre os clientes")
+    parser.add_argument('--cliques', type=int, default=6, help="Cliques por sessão gerada")
+    parser.add_argument('--cenarios', help="JSON com sessões gravadas (substitui as geradas)")
+    parser.add_argument('--aquecimento', type=float, default=10,
+                        help="Segundos de aquecimento, com todos os clientes, antes de medir")
+    parser.add_argument('--max-erros', type=float, default=MAX_TAXA_ERRO_PCT,
+                        help="Taxa de erro (%%) acima da qual a configuração é marcada como inválida")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=60, help="Timeout por requisição (s)")
+    parser.add_argument('--timeout-subida', type=float, default=300, help="Tempo máximo para o servidor subir (s)")
+    parser.add_argument('--saida', help="Arquivo de resultado (.json ou .csv)")
+    args = parser.parse_args(argv)
+    if args.sessoes < 1 or args.cliques < 1:
+        parser.error("--sessoes e --cliques devem ser ao menos 1")
+    if args.pausa < 0:
+        parser.error("--pausa não pode ser negativa")
+
+    env = os.environ.copy()
+    for var, valor in (('CRIMINAL_FILE', args.criminal_file), ('EVENTOS_FILE', args.eventos_file),
+                       ('LOCAIS_FILE', args.locais_file)):
+        if valor:
+            env[var] = os.path.abspath(valor)
+
+    try:
+        sessoes = carregar_sessoes(args.cenarios) if args.cenarios else None
+    except (OSError, ValueError) as e:
+        parser.error(f"--cenarios: {e}")
+
+    resultados = []
+    for config in args.configs:
+        resultado = {'config': nome_config(config), **config, 'clientes': args.clientes, 'pausa_s': args.pausa}
+        try:
+            medidas, sessoes = testar_config(config, env, sessoes, args)
+        except Exception as e:
+            # Uma configuração com problema (classe de worker ausente, timeout na
+            # subida...) não pode derrubar o relatório das demais.
+            print(f"  Falha em {nome_config(config)}: {e}")
+            resultado.update(status='INVÁLIDO', falha=str(e))
+            resultados.append(resultado)
+            continue
+        resultado.update(medidas)
+        resultado['status'] = 'ok' if medidas['taxa_erro_pct'] <= args.max_erros else 'INVÁLIDO'
+        resultados.append(resultado)
+        print(f"  {resultado['vazao_rps']} req/s, {resultado['taxa_erro_pct']}% erros, "
+              f"p99 {resultado['p99_ms']} ms ({resultado['status']})")
+
+    print()
+    imprimir_tabela(resultados, args.max_erros)
+    if args.saida:
+        metadados = {
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'criminal_file': env.get('CRIMINAL_FILE'),
+            'clientes': args.clientes,
+            'duracao_s': args.duracao,
+            'pausa_s': args.pausa,
+            'sessoes': len(sessoes or []),
+            'seed': args.seed,
+            'max_erros_pct': args.max_erros,
+            'cenarios': args.cenarios,
+        }
+        salvar(resultados, args.saida, metadados)
+        print(f"\nResultado salvo em '{args.saida}'.")
+
+
+if __name__ == '__main__':
+    main()